@@ -1,59 +1,359 @@
 import aiohttp
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+import ijson
+from functools import lru_cache
 import math
-from typing import List, Dict, Tuple
+import orjson
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from osm_mcp_server.utils import bbox_around, element_coords, overpass_bbox
+from typing import Any, List, Dict, Tuple, Iterable, Optional
+
+# Public Overpass instance used for every feature query, and its per-client status page
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+OVERPASS_STATUS_URL = "https://overpass-api.de/api/status"
+
+# Concurrent queries the public Overpass instance accepts per client; more are rejected with 429.
+# Used when the instance's /status page can't be read at connect time
+OVERPASS_SLOTS = 2
+
+# Overpass queries rejected as rate limited (429) or timed out under load (504) are
+# retried this many times, waiting up to OVERPASS_BACKOFF * 2**attempt seconds
+OVERPASS_RETRIES = 3
+OVERPASS_BACKOFF = 1.0
+
+# Seconds an idle pooled connection is kept open (aiohttp's default is 15)
+KEEPALIVE_TIMEOUT = 60
+
+# Upper bounds for any upstream request; aiohttp's default allows 5 minutes in total
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=5)
+
+# Identifies this server to Nominatim and Overpass, as their usage policies require
+USER_AGENT = "OSM-MCP-Server/1.0"
+
+# Seconds a persisted reverse geocoding result is reused (addresses rarely change)
+GEOCODE_STORE_TTL = 30 * 24 * 3600
+
+# Rows kept in the persisted store (a response is ~1 KB); the cap is re-applied every
+# GEOCODE_STORE_TRIM_EVERY writes, removing the entries closest to expiry first
+GEOCODE_STORE_MAX_ROWS = 100000
+GEOCODE_STORE_TRIM_EVERY = 1000
+
+# Feature search bboxes are widened to this grid (degrees, ~10 m) before caching
+FEATURE_CACHE_GRID = 0.0001
+
+# Transportation modes accepted by the routing tools and the OSRM profile each maps to
+OSRM_PROFILES = {"car": "driving", "bike": "bike", "foot": "foot"}
+
+# Route geometry options OSRM accepts; anything else would be written unescaped into the URL
+OSRM_OVERVIEWS = ("full", "simplified", "false")
+OSRM_GEOMETRIES = ("geojson", "polyline6", "polyline")
+
+# OSRM request templates, filled with a single % substitution per call. Coordinates
+# are written at 6 decimals (~0.1 m), the same precision the route cache keys use
+_ROUTE_URL = (
+    "http://router.project-osrm.org/route/v1/%s/%.6f,%.6f;%.6f,%.6f"
+    "?overview=%s&geometries=%s&steps=%s&annotations=%s"
+)
+_TABLE_URL = "http://router.project-osrm.org/table/v1/%s/%s"
+_COORDINATE = "%.6f,%.6f"
+
+# Overpass QL template for nearby POI lookups; the bbox goes in the global setting
+_NEARBY_QUERY = "[out:json][bbox:{bbox}];({statements});out body;"
+
+@lru_cache(maxsize=64)
+def _nearby_statements(categories: Tuple[str, ...]) -> str:
+    """Node statements for a set of category keys, built once per distinct category list"""
+    return "".join(f'node["{category}"];' for category in categories)
+
+class GeocodeStore:
+    """
+    SQLite file of raw reverse geocoding responses, kept under the in-memory cache.
+    
+    Survives restarts and can be shared by several server processes (WAL mode allows
+    concurrent readers with one writer). Queries run on a dedicated thread so a slow
+    disk or a lock held by another process never blocks the event loop. Once the store
+    is open, storage errors are ignored so a locked or unwritable file only costs a
+    Nominatim request. Create stores with open().
+    """
+    
+    def __init__(self, path: str, ttl: float = GEOCODE_STORE_TTL, max_rows: int = GEOCODE_STORE_MAX_ROWS):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.db = None
+        self._puts = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geocode-store")
+    
+    @classmethod
+    async def open(cls, path: str, **options) -> "GeocodeStore":
+        """Open (creating if needed) the database file off the event loop; raises sqlite3.Error or OSError"""
+        store = cls(path, **options)
+        try:
+            await store._run(store._connect)
+        except BaseException:
+            store.close()
+            raise
+        return store
+    
+    async def get(self, lat: float, lon: float) -> Optional[bytes]:
+        """Stored response body for a rounded coordinate, or None if missing or expired"""
+        return await self._run(self._get, lat, lon)
+    
+    async def put(self, lat: float, lon: float, body: bytes):
+        """Store a response body for a rounded coordinate"""
+        await self._run(self._put, lat, lon, body)
+    
+    async def _run(self, function, *args):
+        """Run a blocking database call on the store's own thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+    
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=1.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS reverse_geocode "
+            "(lat REAL, lon REAL, expires REAL, body BLOB, PRIMARY KEY (lat, lon))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS reverse_geocode_expires ON reverse_geocode (expires)")
+        self._trim()
+    
+    def _get(self, lat: float, lon: float) -> Optional[bytes]:
+        try:
+            row = self.db.execute(
+                "SELECT body FROM reverse_geocode WHERE lat = ? AND lon = ? AND expires > ?",
+                (lat, lon, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+    
+    def _put(self, lat: float, lon: float, body: bytes):
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO reverse_geocode VALUES (?, ?, ?, ?)",
+                (lat, lon, time.time() + self.ttl, body)
+            )
+        except sqlite3.Error:
+            return
+        # Re-apply the row cap now and then rather than counting rows on every write
+        self._puts += 1
+        if self._puts % GEOCODE_STORE_TRIM_EVERY == 0:
+            self._trim()
+    
+    def _trim(self):
+        """Drop expired rows, then the soonest-expiring rows beyond max_rows"""
+        try:
+            self.db.execute("DELETE FROM reverse_geocode WHERE expires <= ?", (time.time(),))
+            self.db.execute(
+                "DELETE FROM reverse_geocode WHERE rowid IN "
+                "(SELECT rowid FROM reverse_geocode ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            )
+        except sqlite3.Error:
+            pass
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.db is not None:
+            self.db.close()
 
 class OSMClient:
-    def __init__(self, base_url="https://api.openstreetmap.org/api/0.6"):
+    def __init__(self, base_url="https://api.openstreetmap.org/api/0.6", geocode_store: Optional[GeocodeStore] = None):
         self.base_url = base_url
         self.session = None
-        self.cache = {}  # Simple in-memory cache
+        self.geocode_store = geocode_store  # Persisted reverse geocoding, if configured
+        self.geocode_cache = TTLCache(maxsize=1024, ttl=86400)  # Forward geocoding results by normalized query
+        self.cache = TTLCache(maxsize=1024, ttl=3600)  # Reverse geocoding results by rounded coordinate
+        self.feature_cache = TTLCache(maxsize=512, ttl=900)  # Overpass feature searches by bbox cell
+        self.route_cache = TTLCache(maxsize=512, ttl=900)  # OSRM routes and tables by rounded coordinates
+        self.overpass_slots = asyncio.Semaphore(OVERPASS_SLOTS)  # Shared by every Overpass caller
+        self.inflight: Dict[Tuple, asyncio.Future] = {}  # Pending upstream requests by cache key
     
     async def connect(self):
-        self.session = aiohttp.ClientSession()
+        # Keep-alive pool shared by every upstream call (Nominatim, OSRM, Overpass and,
+        # via the app lifespan, tile servers). aiohttp only speaks HTTP/1.1, so idle
+        # connections are kept open across bursts of tool calls instead of paying a new
+        # TCP+TLS handshake per burst
+        connector = aiohttp.TCPConnector(
+            limit=32,
+            limit_per_host=8,
+            ttl_dns_cache=300,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": USER_AGENT},
+            timeout=REQUEST_TIMEOUT
+        )
+        
+        # Match the Overpass slot count to what the instance grants this client, so
+        # queries queue here instead of being bounced with 429
+        self.overpass_slots = asyncio.Semaphore(await self._overpass_slot_count())
+        
+    async def _overpass_slot_count(self) -> int:
+        """Rate limit reported by the Overpass /status page, or OVERPASS_SLOTS if unavailable"""
+        try:
+            async with self.session.get(OVERPASS_STATUS_URL, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 200:
+                    match = re.search(r"^Rate limit: (\d+)", await response.text(), re.MULTILINE)
+                    # 0 means the instance doesn't limit this client
+                    if match and int(match.group(1)) > 0:
+                        return int(match.group(1))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        return OVERPASS_SLOTS
         
     async def disconnect(self):
         if self.session:
             await self.session.close()
+        if self.geocode_store:
+            self.geocode_store.close()
+
+    async def _cached(self, cache: TTLCache, key: Tuple, fetch) -> Any:
+        """Return a cached result, sharing a single in-flight request between concurrent callers"""
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        
+        # Pending requests live outside the bounded caches, so a burst of distinct
+        # lookups cannot evict them and let a duplicate request through
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fetch())
+            self.inflight[key] = future
+            future.add_done_callback(lambda done: self._settle(cache, key, done))
+        # Shielded so one caller giving up does not cancel the request for the others
+        return await asyncio.shield(future)
+
+    def _settle(self, cache: TTLCache, key: Tuple, future: asyncio.Future):
+        """Move a finished request from the in-flight table into its cache"""
+        del self.inflight[key]
+        # Failed lookups are not cached
+        if not future.cancelled() and future.exception() is None:
+            cache[key] = future.result()
 
     async def geocode(self, query: str) -> List[Dict]:
         """Geocode an address or place name"""
+        return await self._geocode(query, nullcontext)
+    
+    async def _geocode(self, query: str, gate) -> List[Dict]:
+        """Geocode with the Nominatim request, and only that, run inside gate()"""
         if not self.session:
             raise RuntimeError("OSM client not connected")
         
-        nominatim_url = "https://nominatim.openstreetmap.org/search"
-        async with self.session.get(
-            nominatim_url,
-            params={
-                "q": query,
-                "format": "json",
-                "limit": 5
-            },
-            headers={"User-Agent": "OSM-MCP-Server/1.0"}
-        ) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                raise Exception(f"Failed to geocode '{query}': {response.status}")
+        async def fetch():
+            nominatim_url = "https://nominatim.openstreetmap.org/search"
+            async with gate(), self.session.get(
+                nominatim_url,
+                params={
+                    "q": query,
+                    "format": "json",
+                    "limit": 5
+                }
+            ) as response:
+                if response.status == 200:
+                    return orjson.loads(await response.read())
+                else:
+                    raise Exception(f"Failed to geocode '{query}': {response.status}")
+        
+        return await self._cached(self.geocode_cache, _geocode_key(query), fetch)
+    
+    async def batch_geocode(self,
+                            queries: Iterable[str],
+                            concurrency: int = 4,
+                            min_interval: float = 1.0) -> List:
+        """Geocode many queries, returning results (or exceptions) in input order; see _rate_limited"""
+        return await self._rate_limited(queries, self._geocode, concurrency, min_interval)
     
     async def reverse_geocode(self, lat: float, lon: float) -> Dict:
         """Reverse geocode coordinates to address"""
+        return await self._reverse_geocode((lat, lon), nullcontext)
+    
+    async def _reverse_geocode(self, point: Tuple[float, float], gate) -> Dict:
+        """Reverse geocode with the Nominatim request, and only that, run inside gate()"""
         if not self.session:
             raise RuntimeError("OSM client not connected")
         
-        nominatim_url = "https://nominatim.openstreetmap.org/reverse"
-        async with self.session.get(
-            nominatim_url,
-            params={
-                "lat": lat,
-                "lon": lon,
-                "format": "json"
-            },
-            headers={"User-Agent": "OSM-MCP-Server/1.0"}
-        ) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                raise Exception(f"Failed to reverse geocode ({lat}, {lon}): {response.status}")
+        lat, lon = point
+        key = _reverse_key(lat, lon)
+        
+        async def fetch():
+            # Responses persisted by this or an earlier process are reused as-is
+            if self.geocode_store:
+                body = await self.geocode_store.get(*key[1:])
+                if body is not None:
+                    return orjson.loads(body)
+            
+            nominatim_url = "https://nominatim.openstreetmap.org/reverse"
+            async with gate(), self.session.get(
+                nominatim_url,
+                params={
+                    "lat": lat,
+                    "lon": lon,
+                    "format": "json"
+                }
+            ) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    result = orjson.loads(body)
+                    if self.geocode_store:
+                        await self.geocode_store.put(*key[1:], body)
+                    return result
+                else:
+                    raise Exception(f"Failed to reverse geocode ({lat}, {lon}): {response.status}")
+        
+        return await self._cached(self.cache, key, fetch)
+
+    async def batch_reverse_geocode(self,
+                                    points: Iterable[Tuple[float, float]],
+                                    concurrency: int = 4,
+                                    min_interval: float = 1.0) -> List:
+        """Reverse geocode many (lat, lon) points, returning results (or exceptions) in input order; see _rate_limited"""
+        return await self._rate_limited(points, self._reverse_geocode, concurrency, min_interval)
+
+    async def _rate_limited(self, items: Iterable, lookup, concurrency: int, min_interval: float) -> List:
+        """
+        Run lookup(item, gate) for many items under a shared Nominatim rate limit.
+        
+        At most concurrency requests are in flight and request starts are spaced
+        min_interval seconds apart (the public Nominatim policy is 1 req/s; pass 0 for
+        a self-hosted instance). The lookup only enters gate() around its upstream
+        request, inside the single-flight fetch: cached and persisted items never queue,
+        and a repeated item joins the first copy's pending request, even while that one
+        is still waiting for its slot. A failed item yields its exception in place of a
+        result.
+        """
+        if not self.session:
+            raise RuntimeError("OSM client not connected")
+        
+        slots = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        next_start = loop.time()
+        
+        @asynccontextmanager
+        async def gate():
+            nonlocal next_start
+            async with slots:
+                # Reserve the next start time before sleeping so waiters queue in order
+                now = loop.time()
+                start = max(next_start, now)
+                next_start = start + min_interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+                yield
+        
+        return await asyncio.gather(*(lookup(item, gate) for item in items), return_exceptions=True)
 
     async def get_route(self, 
                          from_lat: float, 
@@ -62,26 +362,84 @@ class OSMClient:
                          to_lon: float,
                          mode: str = "car",
                          steps: bool = False,
-                         overview: str = "overview",
-                         annotations: bool = True) -> Dict:
+                         overview: str = "simplified",
+                         annotations: bool = False,
+                         geometries: str = "geojson") -> Dict:
         """Get routing information between two points"""
         if not self.session:
             raise RuntimeError("OSM client not connected")
         
+        if overview not in OSRM_OVERVIEWS:
+            raise ValueError(f"Invalid overview '{overview}'. Options are: {', '.join(OSRM_OVERVIEWS)}")
+        if geometries not in OSRM_GEOMETRIES:
+            raise ValueError(f"Invalid geometries '{geometries}'. Options are: {', '.join(OSRM_GEOMETRIES)}")
+        
         # Use OSRM for routing
-        osrm_url = f"http://router.project-osrm.org/route/v1/{mode}/{from_lon},{from_lat};{to_lon},{to_lat}"
+        osrm_url = _ROUTE_URL % (
+            _osrm_profile(mode), from_lon, from_lat, to_lon, to_lat,
+            overview, geometries, "true" if steps else "false", "true" if annotations else "false"
+        )
+        
+        async def fetch():
+            async with self.session.get(osrm_url) as response:
+                if response.status == 200:
+                    return orjson.loads(await response.read())
+                else:
+                    raise Exception(f"Failed to get route: {response.status}")
+        
+        key = ("route", _point_key(from_lat, from_lon), _point_key(to_lat, to_lon), mode, steps, overview, annotations, geometries)
+        return await self._cached(self.route_cache, key, fetch)
+
+    async def batch_routes(self,
+                           pairs: Iterable[Tuple[float, float, float, float]],
+                           mode: str = "car",
+                           concurrency: int = 8,
+                           **options) -> List:
+        """
+        Route many (from_lat, from_lon, to_lat, to_lon) pairs, returning results in input order.
+        
+        At most concurrency requests are in flight (the shared connector allows 8 per
+        host, so more would only queue inside aiohttp). Extra options are passed to
+        get_route. A failed pair yields its exception in place of a result.
+        """
+        if not self.session:
+            raise RuntimeError("OSM client not connected")
+        
+        slots = asyncio.Semaphore(concurrency)
+        
+        async def route(pair):
+            async with slots:
+                return await self.get_route(*pair, mode, **options)
+        
+        return await asyncio.gather(*(route(pair) for pair in pairs), return_exceptions=True)
+
+    async def get_route_table(self,
+                              from_lat: float,
+                              from_lon: float,
+                              destinations: List[Tuple[float, float]],
+                              mode: str = "car") -> Dict:
+        """Get travel durations and distances from one point to many in a single OSRM table request"""
+        if not self.session:
+            raise RuntimeError("OSM client not connected")
+        
+        # The origin is coordinate 0 and the (lat, lon) destinations follow it
+        coordinates = ";".join(_COORDINATE % (lon, lat) for lat, lon in [(from_lat, from_lon), *destinations])
+        osrm_url = _TABLE_URL % (_osrm_profile(mode), coordinates)
         params = {
-            "overview": overview,
-            "geometries": "geojson",
-            "steps": str(steps).lower(),
-            "annotations": str(annotations).lower()
+            "sources": "0",
+            "destinations": ";".join(str(i) for i in range(1, len(destinations) + 1)),
+            "annotations": "duration,distance"
         }
         
-        async with self.session.get(osrm_url, params=params) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                raise Exception(f"Failed to get route: {response.status}")
+        async def fetch():
+            async with self.session.get(osrm_url, params=params) as response:
+                if response.status == 200:
+                    return orjson.loads(await response.read())
+                else:
+                    raise Exception(f"Failed to get route table: {response.status}")
+        
+        key = ("table", _point_key(from_lat, from_lon), tuple(_point_key(lat, lon) for lat, lon in destinations), mode)
+        return await self._cached(self.route_cache, key, fetch)
 
     async def get_nearby_pois(self, 
                              lat: float, 
@@ -92,47 +450,28 @@ class OSMClient:
         if not self.session:
             raise RuntimeError("OSM client not connected")
         
-        # Convert radius to bounding box (approximate)
-        # 1 degree latitude ~= 111km
-        # 1 degree longitude ~= 111km * cos(latitude)
-        lat_delta = radius / 111000
-        lon_delta = radius / (111000 * math.cos(math.radians(lat)))
-        
-        bbox = (
-            lon - lon_delta,
-            lat - lat_delta,
-            lon + lon_delta,
-            lat + lat_delta
-        )
-        
-        # Build Overpass query
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        
         # Default to common POI types if none specified
-        if not categories:
-            categories = ["amenity", "shop", "tourism", "leisure"]
+        categories = tuple(sorted(categories)) if categories else ("amenity", "leisure", "shop", "tourism")
         
-        # Build tag filters
-        tag_filters = []
-        for category in categories:
-            tag_filters.append(f'node["{category}"]({{bbox}});')
+        # Snap the center to ~10 m (the feature cache grid) so nearby repeat lookups
+        # share a cache entry; the query is built from the snapped values too
+        lat, lon, radius = round(lat, 4), round(lon, 4), round(radius)
         
-        query = f"""
-        [out:json];
-        (
-            {" ".join(tag_filters)}
-        );
-        out body;
-        """
+        # Convert radius to bounding box (approximate)
+        bbox = bbox_around(lat, lon, radius)
+        
+        # Build Overpass query
+        query = _NEARBY_QUERY.format(bbox=overpass_bbox(bbox), statements=_nearby_statements(categories))
         
-        query = query.replace("{bbox}", f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}")
+        async def fetch():
+            async with overpass_post(self.session, self.overpass_slots, OVERPASS_URL, query) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    return data.get("elements", [])
+                else:
+                    raise Exception(f"Failed to get nearby POIs: {response.status}")
         
-        async with self.session.post(overpass_url, data={"data": query}) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("elements", [])
-            else:
-                raise Exception(f"Failed to get nearby POIs: {response.status}")
+        return await self._cached(self.feature_cache, ("nearby", lat, lon, radius, categories), fetch)
 
     async def search_features_by_category(self, 
                                          bbox: Tuple[float, float, float, float],
@@ -142,7 +481,10 @@ class OSMClient:
         if not self.session:
             raise RuntimeError("OSM client not connected")
         
-        overpass_url = "https://overpass-api.de/api/interpreter"
+        # Widen the bbox to ~10 m cells so repeat searches of the same area share a cache
+        # entry; the results are trimmed back to the requested bbox afterwards
+        requested_bbox = bbox
+        bbox = _snap_bbox(bbox, grid=FEATURE_CACHE_GRID)
         
         # Build query for specified category and subcategories
         if subcategories:
@@ -151,19 +493,274 @@ class OSMClient:
         else:
             query_filter = f'"{category}"'
         
+        bbox_filter = overpass_bbox(bbox)
         query = f"""
         [out:json];
         (
-          node[{query_filter}]({bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]});
-          way[{query_filter}]({bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]});
-          relation[{query_filter}]({bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]});
+          node[{query_filter}]({bbox_filter});
+          way[{query_filter}]({bbox_filter});
+          relation[{query_filter}]({bbox_filter});
         );
-        out body;
+        out center;
+        """
+        
+        async def fetch():
+            async with overpass_post(self.session, self.overpass_slots, OVERPASS_URL, query) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    return data.get("elements", [])
+                else:
+                    raise Exception(f"Failed to search features by category: {response.status}")
+        
+        key = ("category", bbox, category, tuple(sorted(subcategories)) if subcategories else None)
+        return _within_bbox(await self._cached(self.feature_cache, key, fetch), requested_bbox)
+
+
+    async def search_features_by_categories(self,
+                                           bbox: Tuple[float, float, float, float],
+                                           categories: List[str]) -> List[Dict]:
+        """Search for OSM features carrying any of several category keys in a single query"""
+        if not self.session:
+            raise RuntimeError("OSM client not connected")
+        
+        # Widen the bbox to ~10 m cells so repeat searches of the same area share a cache
+        # entry; the results are trimmed back to the requested bbox afterwards
+        requested_bbox = bbox
+        bbox = _snap_bbox(bbox, grid=FEATURE_CACHE_GRID)
+        
+        # One union over all category keys, bounded once by the global bbox setting
+        tag_filters = "".join(f'nwr["{category}"];' for category in categories)
+        query = f"[out:json][bbox:{overpass_bbox(bbox)}];({tag_filters});out center;"
+        
+        async def fetch():
+            async with overpass_post(self.session, self.overpass_slots, OVERPASS_URL, query) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    return data.get("elements", [])
+                else:
+                    raise Exception(f"Failed to search features by categories: {response.status}")
+        
+        elements = await self._cached(self.feature_cache, ("categories", bbox, tuple(categories)), fetch)
+        return _within_bbox(elements, requested_bbox)
+
+    async def stream_overpass_query(self, query: str):
+        """
+        Run an Overpass QL query and yield its elements as they are parsed.
+        
+        For large one-off queries whose elements are handled as they arrive; the reply
+        is not cached. Raises on a non-200 reply before anything is yielded.
+        """
+        if not self.session:
+            raise RuntimeError("OSM client not connected")
+        
+        async with overpass_post(self.session, self.overpass_slots, OVERPASS_URL, query) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to run Overpass query: {response.status}")
+            async for element in iter_overpass_elements(response):
+                yield element
+
+# Overpass QL templates for batched amenity lookups
+_AMENITY_FILTER = 'nwr["amenity"~"^({amenities})$"]'
+_BATCH_QUERY = "[out:json]{settings};({statements});out center;"
+
+# Overpass replies up to this size (bytes) are parsed in one go instead of streamed
+_BUFFERED_RESPONSE_LIMIT = 4 * 1024 * 1024
+
+
+class OverpassBatcher:
+    """Coalesce concurrent amenity lookups into a single Overpass request"""
+
+    def __init__(self,
+                 session: aiohttp.ClientSession,
+                 overpass_url: str = OVERPASS_URL,
+                 window: float = 0.02,
+                 cache_ttl: float = 300,
+                 slots: asyncio.Semaphore = None):
+        self.session = session
+        self.overpass_url = overpass_url
+        self.window = window  # seconds to wait for other callers to join a batch
+        self.slots = slots or asyncio.Semaphore(OVERPASS_SLOTS)
+        self._pending = []
+        self._flush_task = None
+        self._cache = TTLCache(maxsize=256, ttl=cache_ttl)
+
+    async def fetch_amenities(self,
+                              amenities: Iterable[str],
+                              bbox: Tuple[float, float, float, float]) -> List[Dict]:
+        """
+        Get nodes, ways and relations tagged with any of the given amenity values.
+        
+        The bbox is widened to a 0.01° grid so that nearby lookups share cached
+        results; callers should apply their own distance filter.
         """
+        amenities = frozenset(amenities)
+        bbox = _snap_bbox(bbox)
+        key = (amenities, bbox)
+        if key in self._cache:
+            return self._cache[key]
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((amenities, bbox, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        elements = await future
+        self._cache[key] = elements
+        return elements
+
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+        
+        bboxes = dict.fromkeys(bbox for _, bbox, _ in batch)
+        if len(bboxes) == 1:
+            # A shared bbox goes into the global [bbox:...] setting, so a single
+            # filter over the union of amenity values needs no bbox of its own
+            amenities = frozenset().union(*(amenities for amenities, _, _ in batch))
+            settings = f"[bbox:{overpass_bbox(next(iter(bboxes)))}]"
+            statements = [_AMENITY_FILTER.format(amenities="|".join(sorted(amenities))) + ";"]
+        else:
+            # One nwr statement per distinct (amenities, bbox) pair; Overpass dedupes the union
+            settings = ""
+            statements = dict.fromkeys(
+                _AMENITY_FILTER.format(amenities="|".join(sorted(amenities))) + f"({overpass_bbox(bbox)});"
+                for amenities, bbox, _ in batch
+            )
+        query = _BATCH_QUERY.format(settings=settings, statements="".join(statements))
         
-        async with self.session.post(overpass_url, data={"data": query}) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("elements", [])
-            else:
-                raise Exception(f"Failed to search features by category: {response.status}")
+        # Hand each element to its callers as it is parsed
+        found = [[] for _ in batch]
+        try:
+            async with overpass_post(self.session, self.slots, self.overpass_url, query) as response:
+                response.raise_for_status()
+                async for element in iter_overpass_elements(response):
+                    if len(batch) == 1:
+                        found[0].append(element)
+                        continue
+                    for (amenities, bbox, _), elements in zip(batch, found):
+                        if _matches(element, amenities, bbox):
+                            elements.append(element)
+        except aiohttp.ClientResponseError as e:
+            _fail(batch, Exception(f"Failed to query Overpass: {e.status} {e.message}"))
+            return
+        except Exception as e:
+            _fail(batch, e)
+            return
+        
+        for (_, _, future), elements in zip(batch, found):
+            if not future.done():
+                future.set_result(elements)
+
+
+@asynccontextmanager
+async def overpass_post(session: aiohttp.ClientSession, slots: asyncio.Semaphore, url: str, query: str):
+    """
+    POST an Overpass query while holding one of the shared slots and yield the response.
+    
+    429 and 504 replies are retried up to OVERPASS_RETRIES times with full-jitter
+    exponential backoff; the slot is released while waiting so other queries can run.
+    The last reply is yielded whatever its status, for the caller to report.
+    """
+    for attempt in range(OVERPASS_RETRIES + 1):
+        async with slots:
+            async with session.post(url, data={"data": query}) as response:
+                if response.status not in (429, 504) or attempt == OVERPASS_RETRIES:
+                    yield response
+                    return
+        await asyncio.sleep(random.uniform(0, OVERPASS_BACKOFF * 2 ** attempt))
+
+
+async def iter_overpass_elements(response: aiohttp.ClientResponse):
+    """
+    Yield the elements of an Overpass JSON response.
+    
+    Uncompressed replies of known, moderate size are parsed in one orjson call. Large,
+    chunked or compressed replies are stream-parsed with ijson so the full document is
+    never held in memory; a compressed reply's Content-Length is its wire size, which
+    says little about the decoded size. Element types and keys are interned so large
+    replies share one string per value.
+    """
+    if (
+        "Content-Encoding" not in response.headers
+        and response.content_length is not None
+        and response.content_length <= _BUFFERED_RESPONSE_LIMIT
+    ):
+        # orjson already reuses str objects for repeated object keys
+        for element in orjson.loads(await response.read()).get("elements", []):
+            if "type" in element:
+                element["type"] = sys.intern(element["type"])
+            yield element
+    else:
+        async for element in ijson.items_async(response.content, "elements.item", use_float=True):
+            yield _intern_element(element)
+
+
+def _intern_element(element: Dict) -> Dict:
+    """Rebuild a stream-parsed element with interned keys, tag keys and type"""
+    element = {sys.intern(key): value for key, value in element.items()}
+    if "type" in element:
+        element["type"] = sys.intern(element["type"])
+    tags = element.get("tags")
+    if tags:
+        element["tags"] = {sys.intern(key): value for key, value in tags.items()}
+    return element
+
+
+def _osrm_profile(mode: str) -> str:
+    """Map a travel mode to its OSRM profile, rejecting modes the public server doesn't route"""
+    try:
+        return OSRM_PROFILES[mode]
+    except KeyError:
+        raise ValueError(f"Invalid mode '{mode}'. Options are: {', '.join(OSRM_PROFILES)}") from None
+
+
+def _point_key(lat: float, lon: float) -> Tuple[float, float]:
+    """Cache key for a coordinate; ~0.1 m precision, closer points give the same answer anyway"""
+    return round(lat, 6), round(lon, 6)
+
+
+def _geocode_key(query: str) -> Tuple:
+    """Forward geocode cache key; place names resolve the same way for a long time, and Nominatim ignores case"""
+    return ("geocode", query.strip().lower())
+
+
+def _reverse_key(lat: float, lon: float) -> Tuple:
+    """Reverse geocode cache key"""
+    return ("reverse", *_point_key(lat, lon))
+
+
+def _fail(batch: List, error: Exception):
+    """Propagate a failed batch request to every caller still waiting on it"""
+    for _, _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+def _snap_bbox(bbox: Tuple[float, float, float, float], grid: float = 0.01) -> Tuple[float, float, float, float]:
+    """Expand a (min_lon, min_lat, max_lon, max_lat) bbox outward to the nearest grid lines"""
+    return (
+        round(math.floor(bbox[0] / grid) * grid, 6),
+        round(math.floor(bbox[1] / grid) * grid, 6),
+        round(math.ceil(bbox[2] / grid) * grid, 6),
+        round(math.ceil(bbox[3] / grid) * grid, 6)
+    )
+
+
+def _within_bbox(elements: List[Dict], bbox: Tuple[float, float, float, float]) -> List[Dict]:
+    """Elements whose point or center lies in a bbox; ones without coordinates are kept"""
+    inside = []
+    for element in elements:
+        lat, lon = element_coords(element)
+        if lat is None or lon is None or (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+            inside.append(element)
+    return inside
+
+
+def _matches(element: Dict, amenities: frozenset, bbox: Tuple[float, float, float, float]) -> bool:
+    """Check whether an Overpass element belongs to a batched amenity lookup"""
+    if element.get("tags", {}).get("amenity") not in amenities:
+        return False
+    lat, lon = element_coords(element)
+    if lat is None or lon is None:
+        return False
+    return bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]
@@ -1,28 +1,58 @@
+import aiohttp
+import logging
+import os
+import sqlite3
 from mcp.server.fastmcp import FastMCP, Context
 from dataclasses import dataclass
 from typing import AsyncIterator
 from contextlib import asynccontextmanager
-from osm_mcp_server.client import OSMClient
+from osm_mcp_server.client import GeocodeStore, OSMClient, OverpassBatcher
+
+# Gates client log messages; FastMCP sets the root level from its log_level setting
+logger = logging.getLogger("osm_mcp_server")
+
+async def log_to_client(ctx: Context, level: int, message: str, *args) -> None:
+    """Send a %-style log message to the MCP client, formatting it only when the level is enabled"""
+    if logger.isEnabledFor(level):
+        await ctx.log(logging.getLevelName(level).lower(), message % args if args else message)
 
 # Create application context
 @dataclass
 class AppContext:
     osm_client: OSMClient
+    http_session: aiohttp.ClientSession
+    overpass_batcher: OverpassBatcher
 
 # Define lifespan manager
 @asynccontextmanager
 async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
-    """Manage OSM client lifecycle"""
-    osm_client = OSMClient()
+    """Manage OSM client and shared HTTP session lifecycle"""
+    # Optional SQLite file that keeps reverse geocoding results across restarts; a file
+    # that can't be opened is skipped rather than stopping the server
+    geocode_store = None
+    geocode_store_path = os.environ.get("OSM_MCP_GEOCODE_CACHE")
+    if geocode_store_path:
+        try:
+            geocode_store = await GeocodeStore.open(geocode_store_path)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Not using geocode cache %s: %s", geocode_store_path, e)
+    
+    osm_client = OSMClient(geocode_store=geocode_store)
+    await osm_client.connect()
     try:
-        await osm_client.connect()
-        yield AppContext(osm_client=osm_client)
+        # Tools, resources and the Overpass batcher all share the client's single
+        # keep-alive pool, created once here for the lifetime of the server
+        yield AppContext(
+            osm_client=osm_client,
+            http_session=osm_client.session,
+            overpass_batcher=OverpassBatcher(osm_client.session, slots=osm_client.overpass_slots)
+        )
     finally:
         await osm_client.disconnect()
 
 # Create the MCP server
 mcp = FastMCP(
     "Location-Based App MCP Server",
-    dependencies=["aiohttp", "geojson", "shapely", "haversine"],
+    dependencies=["aiohttp", "geojson", "shapely", "haversine", "numpy", "ijson", "cachetools", "orjson"],
     lifespan=app_lifespan
 )
@@ -1,8 +1,44 @@
-from typing import Tuple
-import json
+from typing import Dict, Tuple
+import asyncio
 import aiohttp
+import orjson
+from cachetools import TTLCache
 from osm_mcp_server.instance import mcp  # Changed from ..instance based on user feedback/runtime context
 
+# Map styles to their respective tile servers
+TILE_SERVERS = {
+    "standard": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+    "cycle": "https://tile.thunderforest.com/cycle/{z}/{x}/{y}.png",
+    "transport": "https://tile.thunderforest.com/transport/{z}/{x}/{y}.png",
+    "landscape": "https://tile.thunderforest.com/landscape/{z}/{x}/{y}.png",
+    "outdoor": "https://tile.thunderforest.com/outdoors/{z}/{x}/{y}.png"
+}
+
+def _http_session() -> aiohttp.ClientSession:
+    """Shared keep-alive session from the server lifespan"""
+    return mcp.get_context().request_context.lifespan_context.http_session
+
+# Tile bytes by (style, z, x, y). A viewport re-requests the same tiles and the OSM
+# tile usage policy asks clients to keep tiles for at least a day
+_tile_cache = TTLCache(maxsize=4096, ttl=86400)
+_tile_fetches: Dict[Tuple, asyncio.Future] = {}  # Pending tile downloads by cache key
+
+async def _fetch_tile(style: str, z: int, x: int, y: int) -> bytes:
+    """Download a tile from the style's server"""
+    tile_url = TILE_SERVERS[style].format(z=z, x=x, y=y)
+    async with _http_session().get(tile_url) as response:
+        if response.status == 200:
+            return await response.read()
+        else:
+            raise Exception(f"Failed to get {style} tile at {z}/{x}/{y}: {response.status}")
+
+def _settle_tile(key: Tuple, future: asyncio.Future):
+    """Move a finished download from the pending table into the tile cache"""
+    del _tile_fetches[key]
+    # Failed downloads are not cached
+    if not future.cancelled() and future.exception() is None:
+        _tile_cache[key] = future.result()
+
 # Add resource endpoints for common location-based app needs
 @mcp.resource("location://place/{query}")
 async def get_place_resource(query: str) -> str:
@@ -15,22 +51,20 @@ async def get_place_resource(query: str) -> str:
     Returns:
         JSON string with place information
     """
-    async with aiohttp.ClientSession() as session:
-        nominatim_url = "https://nominatim.openstreetmap.org/search"
-        async with session.get(
-            nominatim_url,
-            params={
-                "q": query,
-                "format": "json",
-                "limit": 1
-            },
-            headers={"User-Agent": "LocationApp-MCP-Server/1.0"}
-        ) as response:
-            if response.status == 200:
-                data = await response.json()
-                return json.dumps(data)
-            else:
-                raise Exception(f"Failed to get place info for {query}: {response.status}")
+    nominatim_url = "https://nominatim.openstreetmap.org/search"
+    async with _http_session().get(
+        nominatim_url,
+        params={
+            "q": query,
+            "format": "json",
+            "limit": 1
+        }
+    ) as response:
+        if response.status == 200:
+            data = orjson.loads(await response.read())
+            return orjson.dumps(data).decode()
+        else:
+            raise Exception(f"Failed to get place info for {query}: {response.status}")
 
 @mcp.resource("location://map/{style}/{z}/{x}/{y}")
 async def get_map_style(style: str, z: int, x: int, y: int) -> Tuple[bytes, str]:
@@ -46,25 +80,18 @@ async def get_map_style(style: str, z: int, x: int, y: int) -> Tuple[bytes, str]
     Returns:
         Tuple of (tile image bytes, mime type)
     """
-    # Map styles to their respective tile servers
-    tile_servers = {
-        "standard": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
-        "cycle": "https://tile.thunderforest.com/cycle/{z}/{x}/{y}.png",
-        "transport": "https://tile.thunderforest.com/transport/{z}/{x}/{y}.png",
-        "landscape": "https://tile.thunderforest.com/landscape/{z}/{x}/{y}.png",
-        "outdoor": "https://tile.thunderforest.com/outdoors/{z}/{x}/{y}.png"
-    }
-    
-    
-    if style not in tile_servers:
+    if style not in TILE_SERVERS:
         style = "standard"
     
-    tile_url = tile_servers[style].replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+    key = (style, z, x, y)
+    tile_data = _tile_cache.get(key)
+    if tile_data is None:
+        # Concurrent requests for the same tile share one download
+        future = _tile_fetches.get(key)
+        if future is None:
+            future = asyncio.ensure_future(_fetch_tile(style, z, x, y))
+            _tile_fetches[key] = future
+            future.add_done_callback(lambda done: _settle_tile(key, done))
+        tile_data = await asyncio.shield(future)
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(tile_url) as response:
-            if response.status == 200:
-                tile_data = await response.read()
-                return tile_data, "image/png"
-            else:
-                raise Exception(f"Failed to get {style} tile at {z}/{x}/{y}: {response.status}")
+    return tile_data, "image/png"
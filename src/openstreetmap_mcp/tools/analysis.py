@@ -1,10 +1,12 @@
 from typing import Dict, Any
-import math
-import aiohttp
-from datetime import datetime
+import asyncio
+import logging
+from collections import defaultdict
+import numpy as np
 from mcp.server.fastmcp import Context
-from osm_mcp_server.instance import mcp
-from osm_mcp_server.utils import haversine
+from osm_mcp_server.instance import mcp, log_to_client
+from osm_mcp_server.utils import bbox_around, element_coords, overpass_bbox, timestamp
+from osm_mcp_server.utils_fast import haversine_batch
 
 @mcp.tool()
 async def explore_area(
@@ -41,66 +43,50 @@ async def explore_area(
         "natural", "historic", "public_transport"
     ]
     
-    results = {}
-    for i, category in enumerate(categories):
-        await ctx.report_progress(i, len(categories))
-        ctx.info(f"Exploring {category} features...")
+    # Convert radius to bounding box
+    bbox = bbox_around(latitude, longitude, radius)
+    
+    # Query all categories in one Overpass request, concurrently with the center address
+    await ctx.report_progress(0, len(categories))
+    await log_to_client(ctx, logging.INFO, "Exploring %s features...", ", ".join(categories))
+    features, address_info = await asyncio.gather(
+        osm_client.search_features_by_categories(bbox, categories),
+        osm_client.reverse_geocode(latitude, longitude),
+        return_exceptions=True
+    )
+    
+    if isinstance(features, Exception):
+        await log_to_client(ctx, logging.WARNING, "Error fetching features: %s", features)
+        features = []
+    
+    # Group by category and subcategory in a single pass: the category keys present
+    # on a feature come from one set intersection, and a feature tagged with several
+    # categories shares one entry under each of them. defaultdict buckets avoid
+    # allocating a throwaway list per setdefault call on dense areas.
+    grouped = {category: defaultdict(list) for category in categories}
+    present_keys = frozenset(categories).intersection
+    for feature in features:
+        tags = feature.get("tags", {})
+        present = present_keys(tags)
+        if not present:
+            continue
         
-        try:
-            # Convert radius to bounding box
-            lat_delta = radius / 111000
-            lon_delta = radius / (111000 * math.cos(math.radians(latitude)))
-            
-            bbox = (
-                longitude - lon_delta,
-                latitude - lat_delta,
-                longitude + lon_delta,
-                latitude + lat_delta
-            )
-            
-            features = await osm_client.search_features_by_category(bbox, category)
-            
-            # Group by subcategory
-            subcategories = {}
-            for feature in features:
-                tags = feature.get("tags", {})
-                subcategory = tags.get(category)
-                
-                if subcategory:
-                    if subcategory not in subcategories:
-                        subcategories[subcategory] = []
-                    
-                    # Get coordinates based on feature type
-                    coords = {}
-                    if feature.get("type") == "node":
-                        coords = {
-                            "latitude": feature.get("lat"),
-                            "longitude": feature.get("lon")
-                        }
-                    elif "center" in feature:
-                        coords = {
-                            "latitude": feature.get("center", {}).get("lat"),
-                            "longitude": feature.get("center", {}).get("lon")
-                        }
-                    
-                    subcategories[subcategory].append({
-                        "id": feature.get("id"),
-                        "name": tags.get("name", "Unnamed"),
-                        "coordinates": coords,
-                        "type": feature.get("type"),
-                        "tags": tags
-                    })
-            
-            results[category] = subcategories
-            
-        except Exception as e:
-            ctx.warning(f"Error fetching {category} features: {str(e)}")
-            results[category] = {}
+        lat, lon = element_coords(feature)
+        place = {
+            "id": feature.get("id"),
+            "name": tags.get("name", "Unnamed"),
+            "coordinates": {"latitude": lat, "longitude": lon} if lat is not None else {},
+            "type": feature.get("type"),
+            "tags": tags
+        }
+        for category in present:
+            subcategory = tags[category]
+            if subcategory:
+                grouped[category][subcategory].append(place)
+    results = {category: dict(subcategories) for category, subcategories in grouped.items()}
     
-    # Get address information for the center point
-    try:
-        address_info = await osm_client.reverse_geocode(latitude, longitude)
-    except Exception:
+    # Address information for the center point
+    if isinstance(address_info, Exception):
         address_info = {"error": "Could not retrieve address information"}
     
     # Report completion
@@ -122,9 +108,51 @@ async def explore_area(
         "address": address_info,
         "categories": results,
         "total_features": total_features,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp()
     }
 
+# Categories to analyze for neighborhood quality
+NEIGHBORHOOD_CATEGORIES = [
+    # Essential services
+    {"name": "groceries", "tags": ["shop=supermarket", "shop=convenience", "shop=grocery"]},
+    {"name": "restaurants", "tags": ["amenity=restaurant", "amenity=cafe", "amenity=fast_food"]},
+    {"name": "healthcare", "tags": ["amenity=hospital", "amenity=doctors", "amenity=pharmacy"]},
+    {"name": "education", "tags": ["amenity=school", "amenity=kindergarten", "amenity=university"]},
+
+    # Transportation
+    {"name": "public_transport", "tags": ["public_transport=stop_position", "railway=station", "amenity=bus_station"]},
+
+    # Recreation
+    {"name": "parks", "tags": ["leisure=park", "leisure=garden", "leisure=playground"]},
+    {"name": "sports", "tags": ["leisure=sports_centre", "leisure=fitness_centre", "leisure=swimming_pool"]},
+
+    # Culture and entertainment
+    {"name": "entertainment", "tags": ["amenity=theatre", "amenity=cinema", "amenity=arts_centre"]},
+
+    # Other amenities
+    {"name": "shopping", "tags": ["shop=mall", "shop=department_store", "shop=clothes"]},
+    {"name": "services", "tags": ["amenity=bank", "amenity=post_office", "amenity=atm"]}
+]
+
+def _compile_neighborhood_query(categories):
+    """Index the category tags and build the combined Overpass query template for them"""
+    # (key, value) -> category names, so each element is bucketed in one pass over its own tags
+    tag_index = {}
+    for category in categories:
+        for tag in category["tags"]:
+            tag_index.setdefault(tuple(tag.split("=")), []).append(category["name"])
+    
+    # One regex filter per tag key; only the bbox is filled in per call
+    values_by_key = {}
+    for key, value in tag_index:
+        values_by_key.setdefault(key, []).append(value)
+    tag_filters = "".join(
+        f'nwr["{key}"~"^({"|".join(values)})$"];' for key, values in values_by_key.items()
+    )
+    return tag_index, "[out:json][bbox:{bbox}];(" + tag_filters + ");out center;"
+
+_NEIGHBORHOOD_TAG_INDEX, _NEIGHBORHOOD_QUERY = _compile_neighborhood_query(NEIGHBORHOOD_CATEGORIES)
+
 @mcp.tool()
 async def analyze_neighborhood(
     latitude: float,
@@ -158,126 +186,94 @@ async def analyze_neighborhood(
     """
     osm_client = ctx.request_context.lifespan_context.osm_client
     
-    # Get address information for the center point
-    address_info = await osm_client.reverse_geocode(latitude, longitude)
+    categories = NEIGHBORHOOD_CATEGORIES
     
-    # Categories to analyze for neighborhood quality
-    categories = [
-        # Essential services
-        {"name": "groceries", "tags": ["shop=supermarket", "shop=convenience", "shop=grocery"]},
-        {"name": "restaurants", "tags": ["amenity=restaurant", "amenity=cafe", "amenity=fast_food"]},
-        {"name": "healthcare", "tags": ["amenity=hospital", "amenity=doctors", "amenity=pharmacy"]},
-        {"name": "education", "tags": ["amenity=school", "amenity=kindergarten", "amenity=university"]},
-        
-        # Transportation
-        {"name": "public_transport", "tags": ["public_transport=stop_position", "railway=station", "amenity=bus_station"]},
-        
-        # Recreation
-        {"name": "parks", "tags": ["leisure=park", "leisure=garden", "leisure=playground"]},
-        {"name": "sports", "tags": ["leisure=sports_centre", "leisure=fitness_centre", "leisure=swimming_pool"]},
-        
-        # Culture and entertainment
-        {"name": "entertainment", "tags": ["amenity=theatre", "amenity=cinema", "amenity=arts_centre"]},
-        
-        # Other amenities
-        {"name": "shopping", "tags": ["shop=mall", "shop=department_store", "shop=clothes"]},
-        {"name": "services", "tags": ["amenity=bank", "amenity=post_office", "amenity=atm"]}
-    ]
+    # Convert radius to bounding box
+    bbox = bbox_around(latitude, longitude, radius)
+    
+    query = _NEIGHBORHOOD_QUERY.format(bbox=overpass_bbox(bbox))
+    
+    features_by_category = {category["name"]: [] for category in categories}
+    
+    async def query_features():
+        """Bucket the neighborhood features by category, returning the query error if any"""
+        await log_to_client(ctx, logging.INFO, "Querying neighborhood features...")
+        try:
+            # Bucket elements as they are parsed, overlapping the work with the download
+            async for feature in osm_client.stream_overpass_query(query):
+                names = {
+                    name
+                    for tag in feature.get("tags", {}).items()
+                    for name in _NEIGHBORHOOD_TAG_INDEX.get(tag, ())
+                }
+                for name in names:
+                    features_by_category[name].append(feature)
+        except Exception as e:
+            await log_to_client(ctx, logging.WARNING, "Error querying neighborhood features: %s", e)
+            return e
+        return None
     
-    # Build overpass queries and collect results
+    # Get address information for the center point concurrently with the feature query
+    address_info, query_error = await asyncio.gather(
+        osm_client.reverse_geocode(latitude, longitude),
+        query_features(),
+        return_exceptions=True
+    )
+    if isinstance(address_info, Exception):
+        raise address_info
+    
+    # Calculate metrics for each category
     results = {}
     scores = {}
     
     for i, category in enumerate(categories):
         await ctx.report_progress(i, len(categories))
-        ctx.info(f"Analyzing {category['name']} in neighborhood...")
-        
-        # Convert radius to bounding box
-        lat_delta = radius / 111000
-        lon_delta = radius / (111000 * math.cos(math.radians(latitude)))
-        
-        bbox = (
-            longitude - lon_delta,
-            latitude - lat_delta,
-            longitude + lon_delta,
-            latitude + lat_delta
-        )
-        
-        # Build Overpass query
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        
-        # Create query for category tags
-        tag_filters = []
-        for tag in category["tags"]:
-            key, value = tag.split("=")
-            tag_filters.append(f'node["{key}"="{value}"]({{bbox}});')
-            tag_filters.append(f'way["{key}"="{value}"]({{bbox}});')
+        await log_to_client(ctx, logging.INFO, "Analyzing %s in neighborhood...", category["name"])
         
-        query = f"""
-        [out:json];
-        (
-            {" ".join(tag_filters)}
-        );
-        out body;
-        """
+        if query_error is not None:
+            results[category["name"]] = {"error": str(query_error)}
+            scores[category["name"]] = 0
+            continue
         
-        query = query.replace("{bbox}", f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}")
+        features = features_by_category[category["name"]]
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(overpass_url, data={"data": query}) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        features = data.get("elements", [])
-                    else:
-                        ctx.warning(f"Failed to analyze {category['name']}: {response.status}")
-                        features = []
-                        
-            # Process and calculate metrics
-            feature_list = []
-            distances = []
-            
+            # Collect the features with valid coordinates
+            located, lats, lons = [], [], []
             for feature in features:
-                tags = feature.get("tags", {})
-                
-                # Get coordinates based on feature type
-                coords = {}
-                if feature.get("type") == "node":
-                    coords = {
-                        "latitude": feature.get("lat"),
-                        "longitude": feature.get("lon")
-                    }
-                elif "center" in feature:
-                    coords = {
-                        "latitude": feature.get("center", {}).get("lat"),
-                        "longitude": feature.get("center", {}).get("lon")
-                    }
-                
-                # Skip if no valid coordinates
-                if not coords:
+                lat, lon = element_coords(feature)
+                if lat is None or lon is None:
                     continue
-                
-                # Calculate distance from center point
-                distance = haversine(latitude, longitude, coords["latitude"], coords["longitude"])
-                distances.append(distance)
-                
+                located.append(feature)
+                lats.append(lat)
+                lons.append(lon)
+            
+            # Distances from the center point in one vectorized pass
+            distances = haversine_batch(latitude, longitude, lats, lons)
+            
+            # Calculate metrics
+            count = len(located)
+            avg_distance = float(distances.mean()) if count > 0 else None
+            min_distance = float(distances.min()) if count > 0 else None
+            
+            # Only the nearest 10 features are returned: partition them out in O(n)
+            # and sort just those, rather than sorting every feature
+            nearest = np.argpartition(distances, 9)[:10] if count > 10 else np.arange(count)
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+            
+            feature_list = []
+            for idx in nearest.tolist():
+                feature = located[idx]
+                tags = feature.get("tags", {})
                 feature_list.append({
                     "id": feature.get("id"),
                     "name": tags.get("name", "Unnamed"),
                     "type": feature.get("type"),
-                    "coordinates": coords,
-                    "distance": round(distance, 1),
+                    "coordinates": {"latitude": lats[idx], "longitude": lons[idx]},
+                    "distance": round(float(distances[idx]), 1),
                     "tags": tags
                 })
             
-            # Sort by distance
-            feature_list.sort(key=lambda x: x["distance"])
-            
-            # Calculate metrics
-            count = len(feature_list)
-            avg_distance = sum(distances) / count if count > 0 else None
-            min_distance = min(distances) if count > 0 else None
-            
             # Score this category (0-10)
             # Higher score for more amenities and closer proximity
             if count == 0:
@@ -291,7 +287,7 @@ async def analyze_neighborhood(
             # Store results
             results[category["name"]] = {
                 "count": count,
-                "features": feature_list[:10],  # Limit to top 10
+                "features": feature_list,
                 "metrics": {
                     "total_count": count,
                     "avg_distance": round(avg_distance, 1) if avg_distance else None,
@@ -302,7 +298,7 @@ async def analyze_neighborhood(
             scores[category["name"]] = category_score
             
         except Exception as e:
-            ctx.warning(f"Error analyzing {category['name']}: {str(e)}")
+            await log_to_client(ctx, logging.WARNING, "Error analyzing %s: %s", category["name"], e)
             results[category["name"]] = {"error": str(e)}
             scores[category["name"]] = 0
     
@@ -346,5 +342,5 @@ async def analyze_neighborhood(
         },
         "categories": results,
         "analysis_radius": radius,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp()
     }
@@ -1,20 +1,57 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import logging
 import math
-import aiohttp
+import numpy as np
 from mcp.server.fastmcp import Context
-from osm_mcp_server.instance import mcp  # Changed from ..instance based on user feedback/runtime context
-from osm_mcp_server.utils import haversine
+from osm_mcp_server.instance import mcp, log_to_client  # Changed from ..instance based on user feedback/runtime context
+from osm_mcp_server.utils import bbox_around, element_coords
+from osm_mcp_server.utils_fast import EARTH_RADIUS, haversine_terms, radius_candidates
 
 # Note: These are extra tools that are not imported by default in server.py
 # To enable them, import this module in server.py
 
+EDUCATION_AMENITIES = ("school", "university", "kindergarten", "college")
+
+def _within_radius(latitude: float,
+                   longitude: float,
+                   lats: List[float],
+                   lons: List[float],
+                   radius: float,
+                   limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the coordinates within radius meters of a center point, nearest first.
+    
+    Points are first shortlisted with a trig-free equirectangular test, and the exact
+    haversine term sin²(d/2R) is only computed for the survivors and compared against
+    sin²(r/2R) directly, so the arcsin/sqrt needed to turn it into meters only runs for
+    the points that are kept. When limit is given, only the nearest limit points are
+    selected (O(n) partition) before sorting.
+    
+    Returns:
+        Tuple of (indices into lats/lons, distances in meters for those indices), sorted by distance
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    indices = radius_candidates(latitude, longitude, lats, lons, radius)
+    a = haversine_terms(latitude, longitude, lats[indices], lons[indices])
+    keep = a <= math.sin(radius / (2 * EARTH_RADIUS)) ** 2
+    indices, a = indices[keep], a[keep]
+    if limit is not None and limit < indices.size:
+        nearest = np.argpartition(a, limit - 1)[:limit] if limit > 0 else np.arange(0)
+        indices, a = indices[nearest], a[nearest]
+    # The haversine term is monotonic in distance, so it can be ordered before conversion
+    order = np.argsort(a, kind="stable")
+    return indices[order], 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a[order]))
+
 @mcp.tool()
 async def find_schools_nearby(
     latitude: float,
     longitude: float,
     ctx: Context,
     radius: float = 2000,
-    education_levels: List[str] = None
+    education_levels: List[str] = None,
+    limit: int = 50,
+    include_tags: bool = False
 ) -> Dict[str, Any]:
     """
     Locate educational institutions near a specific location, filtered by education level.
@@ -30,6 +67,8 @@ async def find_schools_nearby(
         radius: Search radius in meters (defaults to 2000m/2km)
         education_levels: Optional list of specific education levels to filter by
                          (e.g., ["elementary", "secondary", "university"])
+        limit: Maximum number of results to return, nearest first (defaults to 50)
+        include_tags: Include the raw OSM tags of each result (defaults to False)
         
     Returns:
         List of educational institutions with:
@@ -39,52 +78,14 @@ async def find_schools_nearby(
         - Contact information if available
         - Other relevant metadata
     """
-    # Convert radius to bounding box (approximate)
-    lat_delta = radius / 111000
-    lon_delta = radius / (111000 * math.cos(math.radians(latitude)))
-    
-    bbox = (
-        longitude - lon_delta,
-        latitude - lat_delta,
-        longitude + lon_delta,
-        latitude + lat_delta
-    )
-    
-    # Build Overpass query for educational institutions
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    # Create query for amenity=school and other education-related tags
-    education_filters = [
-        'node["amenity"="school"]({{bbox}});',
-        'way["amenity"="school"]({{bbox}});',
-        'node["amenity"="university"]({{bbox}});',
-        'way["amenity"="university"]({{bbox}});',
-        'node["amenity"="kindergarten"]({{bbox}});',
-        'way["amenity"="kindergarten"]({{bbox}});',
-        'node["amenity"="college"]({{bbox}});',
-        'way["amenity"="college"]({{bbox}});'
-    ]
-    
-    query = f"""
-    [out:json];
-    (
-        {" ".join(education_filters)}
-    );
-    out body;
-    """
+    bbox = bbox_around(latitude, longitude, radius)
     
-    query = query.replace("{bbox}", f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}")
+    # Educational amenities are matched with a single nwr regex statement
+    batcher = ctx.request_context.lifespan_context.overpass_batcher
+    schools = await batcher.fetch_amenities(EDUCATION_AMENITIES, bbox)
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(overpass_url, data={"data": query}) as response:
-            if response.status == 200:
-                data = await response.json()
-                schools = data.get("elements", [])
-            else:
-                raise Exception(f"Failed to find schools: {response.status}")
-    
-    # Process and filter results
-    results = []
+    # Filter on tags first; distances are computed for all survivors at once
+    candidates, lats, lons = [], [], []
     for school in schools:
         tags = school.get("tags", {})
         school_type = tags.get("school", "")
@@ -93,44 +94,39 @@ async def find_schools_nearby(
         if education_levels and school_type and school_type not in education_levels:
             continue
         
-        # Get coordinates based on feature type
-        coords = {}
-        if school.get("type") == "node":
-            coords = {
-                "latitude": school.get("lat"),
-                "longitude": school.get("lon")
-            }
-        elif "center" in school:
-            coords = {
-                "latitude": school.get("center", {}).get("lat"),
-                "longitude": school.get("center", {}).get("lon")
-            }
-        
         # Skip if no valid coordinates
-        if not coords:
+        lat, lon = element_coords(school)
+        if lat is None:
             continue
         
-        distance = haversine(latitude, longitude, coords["latitude"], coords["longitude"])
-        
-        results.append({
+        candidates.append(school)
+        lats.append(lat)
+        lons.append(lon)
+    
+    indices, distances = _within_radius(latitude, longitude, lats, lons, radius, limit)
+    
+    results = []
+    for i, distance in zip(indices.tolist(), distances.tolist()):
+        school = candidates[i]
+        tags = school.get("tags", {})
+        result = {
             "id": school.get("id"),
             "name": tags.get("name", "Unnamed School"),
             "amenity_type": tags.get("amenity", ""),
-            "school_type": school_type,
+            "school_type": tags.get("school", ""),
             "education_level": tags.get("isced", ""),
-            "coordinates": coords,
+            "coordinates": {"latitude": lats[i], "longitude": lons[i]},
             "distance": round(distance, 1),
             "address": {
                 "street": tags.get("addr:street", ""),
                 "housenumber": tags.get("addr:housenumber", ""),
                 "city": tags.get("addr:city", ""),
                 "postcode": tags.get("addr:postcode", "")
-            },
-            "tags": tags
-        })
-    
-    # Sort by distance
-    results.sort(key=lambda x: x["distance"])
+            }
+        }
+        if include_tags:
+            result["tags"] = tags
+        results.append(result)
     
     return {
         "query": {
@@ -150,7 +146,9 @@ async def find_ev_charging_stations(
     ctx: Context,
     radius: float = 5000,
     connector_types: List[str] = None,
-    min_power: float = None
+    min_power: float = None,
+    limit: int = 50,
+    include_tags: bool = False
 ) -> Dict[str, Any]:
     """
     Locate electric vehicle charging stations near a specific location.
@@ -167,6 +165,8 @@ async def find_ev_charging_stations(
         connector_types: Optional list of specific connector types to filter by
                         (e.g., ["type2", "ccs", "tesla"])
         min_power: Minimum charging power in kW
+        limit: Maximum number of results to return, nearest first (defaults to 50)
+        include_tags: Include the raw OSM tags of each result (defaults to False)
         
     Returns:
         List of charging stations with:
@@ -179,80 +179,28 @@ async def find_ev_charging_stations(
     """
     osm_client = ctx.request_context.lifespan_context.osm_client
     
-    # Convert radius to bounding box
-    lat_delta = radius / 111000
-    lon_delta = radius / (111000 * math.cos(math.radians(latitude)))
-    
-    bbox = (
-        longitude - lon_delta,
-        latitude - lat_delta,
-        longitude + lon_delta,
-        latitude + lat_delta
-    )
-    
-    # Build Overpass query for EV charging stations
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    query = f"""
-    [out:json];
-    (
-        node["amenity"="charging_station"]({{bbox}});
-        way["amenity"="charging_station"]({{bbox}});
-    );
-    out body;
-    """
+    bbox = bbox_around(latitude, longitude, radius)
     
-    query = query.replace("{bbox}", f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}")
+    batcher = ctx.request_context.lifespan_context.overpass_batcher
+    stations = await batcher.fetch_amenities(("charging_station",), bbox)
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(overpass_url, data={"data": query}) as response:
-            if response.status == 200:
-                data = await response.json()
-                stations = data.get("elements", [])
-            else:
-                raise Exception(f"Failed to find charging stations: {response.status}")
+    wanted_connectors = frozenset(connector_types) if connector_types else None
     
-    # Process and filter results
-    results = []
+    # Filter on tags first; distances are computed for all survivors at once
+    candidates, lats, lons = [], [], []
     for station in stations:
         tags = station.get("tags", {})
         
-        # Get coordinates based on feature type
-        coords = {}
-        if station.get("type") == "node":
-            coords = {
-                "latitude": station.get("lat"),
-                "longitude": station.get("lon")
-            }
-        elif "center" in station:
-            coords = {
-                "latitude": station.get("center", {}).get("lat"),
-                "longitude": station.get("center", {}).get("lon")
-            }
-        
         # Skip if no valid coordinates
-        if not coords:
+        lat, lon = element_coords(station)
+        if lat is None:
             continue
         
-        # Extract connector information
-        connectors = []
-        for key, value in tags.items():
-            if key.startswith("socket:"):
-                connector_type = key.split(":", 1)[1]
-                connectors.append({
-                    "type": connector_type,
-                    "count": value if value.isdigit() else 1
-                })
-        
-        # Filter by connector type if specified
-        if connector_types:
-            has_matching_connector = False
-            for connector in connectors:
-                if connector["type"] in connector_types:
-                    has_matching_connector = True
-                    break
-            if not has_matching_connector:
-                continue
+        # Filter by connector type if specified, straight from the socket:* keys
+        if wanted_connectors and not any(
+            key[7:] in wanted_connectors for key in tags if key.startswith("socket:")
+        ):
+            continue
         
         # Extract power information
         power = None
@@ -266,13 +214,28 @@ async def find_ev_charging_stations(
         if min_power is not None and (power is None or power < min_power):
             continue
         
-        distance = haversine(latitude, longitude, coords["latitude"], coords["longitude"])
+        candidates.append((station, power))
+        lats.append(lat)
+        lons.append(lon)
+    
+    indices, distances = _within_radius(latitude, longitude, lats, lons, radius, limit)
+    
+    results = []
+    for i, distance in zip(indices.tolist(), distances.tolist()):
+        station, power = candidates[i]
+        tags = station.get("tags", {})
+        
+        # Extract connector information for the stations that are kept
+        connectors = [
+            {"type": key.split(":", 1)[1], "count": value if value.isdigit() else 1}
+            for key, value in tags.items() if key.startswith("socket:")
+        ]
         
-        results.append({
+        result = {
             "id": station.get("id"),
             "name": tags.get("name", "Unnamed Charging Station"),
             "operator": tags.get("operator", "Unknown"),
-            "coordinates": coords,
+            "coordinates": {"latitude": lats[i], "longitude": lons[i]},
             "distance": round(distance, 1),
             "connectors": connectors,
             "capacity": tags.get("capacity", "Unknown"),
@@ -285,12 +248,11 @@ async def find_ev_charging_stations(
                 "housenumber": tags.get("addr:housenumber", ""),
                 "city": tags.get("addr:city", ""),
                 "postcode": tags.get("addr:postcode", "")
-            },
-            "tags": tags
-        })
-    
-    # Sort by distance
-    results.sort(key=lambda x: x["distance"])
+            }
+        }
+        if include_tags:
+            result["tags"] = tags
+        results.append(result)
     
     return {
         "query": {
@@ -310,7 +272,9 @@ async def find_parking_facilities(
     longitude: float,
     ctx: Context,
     radius: float = 1000,
-    parking_type: str = None  # e.g., "surface", "underground", "multi-storey"
+    parking_type: str = None,  # e.g., "surface", "underground", "multi-storey"
+    limit: int = 50,
+    include_tags: bool = False
 ) -> Dict[str, Any]:
     """
     Locate parking facilities near a specific location.
@@ -325,6 +289,8 @@ async def find_parking_facilities(
         radius: Search radius in meters (defaults to 1000m/1km)
         parking_type: Optional filter for specific types of parking facilities
                      ("surface", "underground", "multi-storey", etc.)
+        limit: Maximum number of results to return, nearest first (defaults to 50)
+        include_tags: Include the raw OSM tags of each result (defaults to False)
         
     Returns:
         List of parking facilities with:
@@ -336,42 +302,13 @@ async def find_parking_facilities(
     """
     osm_client = ctx.request_context.lifespan_context.osm_client
     
-    # Convert radius to bounding box
-    lat_delta = radius / 111000
-    lon_delta = radius / (111000 * math.cos(math.radians(latitude)))
-    
-    bbox = (
-        longitude - lon_delta,
-        latitude - lat_delta,
-        longitude + lon_delta,
-        latitude + lat_delta
-    )
-    
-    # Build Overpass query for parking facilities
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    query = f"""
-    [out:json];
-    (
-        node["amenity"="parking"]({{bbox}});
-        way["amenity"="parking"]({{bbox}});
-        relation["amenity"="parking"]({{bbox}});
-    );
-    out body;
-    """
-    
-    query = query.replace("{bbox}", f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}")
+    bbox = bbox_around(latitude, longitude, radius)
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(overpass_url, data={"data": query}) as response:
-            if response.status == 200:
-                data = await response.json()
-                parking_facilities = data.get("elements", [])
-            else:
-                raise Exception(f"Failed to find parking facilities: {response.status}")
+    batcher = ctx.request_context.lifespan_context.overpass_batcher
+    parking_facilities = await batcher.fetch_amenities(("parking",), bbox)
     
-    # Process and filter results
-    results = []
+    # Filter on tags first; distances are computed for all survivors at once
+    candidates, lats, lons = [], [], []
     for facility in parking_facilities:
         tags = facility.get("tags", {})
         
@@ -379,30 +316,26 @@ async def find_parking_facilities(
         if parking_type and tags.get("parking", "") != parking_type:
             continue
         
-        # Get coordinates based on feature type
-        coords = {}
-        if facility.get("type") == "node":
-            coords = {
-                "latitude": facility.get("lat"),
-                "longitude": facility.get("lon")
-            }
-        elif "center" in facility:
-            coords = {
-                "latitude": facility.get("center", {}).get("lat"),
-                "longitude": facility.get("center", {}).get("lon")
-            }
-        
         # Skip if no valid coordinates
-        if not coords:
+        lat, lon = element_coords(facility)
+        if lat is None:
             continue
         
-        distance = haversine(latitude, longitude, coords["latitude"], coords["longitude"])
-        
-        results.append({
+        candidates.append(facility)
+        lats.append(lat)
+        lons.append(lon)
+    
+    indices, distances = _within_radius(latitude, longitude, lats, lons, radius, limit)
+    
+    results = []
+    for i, distance in zip(indices.tolist(), distances.tolist()):
+        facility = candidates[i]
+        tags = facility.get("tags", {})
+        result = {
             "id": facility.get("id"),
             "name": tags.get("name", "Unnamed Parking"),
             "type": tags.get("parking", "surface"),
-            "coordinates": coords,
+            "coordinates": {"latitude": lats[i], "longitude": lons[i]},
             "distance": round(distance, 1),
             "capacity": tags.get("capacity", "Unknown"),
             "fee": tags.get("fee", "Unknown"),
@@ -414,12 +347,11 @@ async def find_parking_facilities(
                 "housenumber": tags.get("addr:housenumber", ""),
                 "city": tags.get("addr:city", ""),
                 "postcode": tags.get("addr:postcode", "")
-            },
-            "tags": tags
-        })
-    
-    # Sort by distance
-    results.sort(key=lambda x: x["distance"])
+            }
+        }
+        if include_tags:
+            result["tags"] = tags
+        results.append(result)
     
     return {
         "query": {
@@ -458,56 +390,61 @@ async def suggest_meeting_point(
         - List of suggested venues with names and details
         - Total number of matching venues in the area
     """
-    osm_client = ctx.request_context.lifespan_context.osm_client
+    batcher = ctx.request_context.lifespan_context.overpass_batcher
     
     if len(locations) < 2:
         raise ValueError("Need at least two locations to suggest a meeting point")
     
-    # Calculate the center point (simple average)
-    avg_lat = sum(loc.get("latitude", 0) for loc in locations) / len(locations)
-    avg_lon = sum(loc.get("longitude", 0) for loc in locations) / len(locations)
+    # The venue type is interpolated into the Overpass regex, so only accept plain tag values
+    if not venue_type.replace("_", "").isalnum():
+        raise ValueError(f"Invalid venue type: {venue_type}")
     
-    ctx.info(f"Calculating center point for {len(locations)} locations: ({avg_lat}, {avg_lon})")
+    # Calculate the center point as the centroid on the unit sphere, which unlike a plain
+    # lat/lon average stays correct across the antimeridian and at high latitudes
+    lat_r = np.radians([loc.get("latitude", 0) for loc in locations])
+    lon_r = np.radians([loc.get("longitude", 0) for loc in locations])
+    cx = float(np.mean(np.cos(lat_r) * np.cos(lon_r)))
+    cy = float(np.mean(np.cos(lat_r) * np.sin(lon_r)))
+    cz = float(np.mean(np.sin(lat_r)))
+    avg_lat = math.degrees(math.atan2(cz, math.hypot(cx, cy)))
+    avg_lon = math.degrees(math.atan2(cy, cx))
     
-    # Search for venues around this center point
-    venues = await osm_client.get_nearby_pois(
-        avg_lat, avg_lon, 
-        radius=500,  # Search within 500m of center
-        categories=["amenity"]
-    )
+    await log_to_client(ctx, logging.INFO, "Calculating center point for %d locations: (%s, %s)", len(locations), avg_lat, avg_lon)
     
-    # Filter venues by type
-    matching_venues = []
+    # Fetch only the requested venue type, once at the widest radius, and narrow it
+    # down locally rather than issuing a second Overpass request when nothing is close by
+    bbox = bbox_around(avg_lat, avg_lon, 1000)
+    venues = await batcher.fetch_amenities((venue_type,), bbox)
+    
+    candidates, lats, lons = [], [], []
     for venue in venues:
+        lat, lon = element_coords(venue)
+        if lat is not None:
+            candidates.append(venue)
+            lats.append(lat)
+            lons.append(lon)
+    
+    indices, distances = _within_radius(avg_lat, avg_lon, lats, lons, 1000)
+    
+    # Distances come back sorted, so the venues within 500m of center are a prefix
+    nearby = int(np.searchsorted(distances, 500, side="right"))
+    if nearby:
+        indices = indices[:nearby]
+    else:
+        await log_to_client(ctx, logging.INFO, "No %s found within 500m, expanding search to 1000m", venue_type)
+    
+    # Only the top 5 venues are returned, nearest first
+    matching_venues = []
+    for i in indices[:5].tolist():
+        venue = candidates[i]
         tags = venue.get("tags", {})
-        if tags.get("amenity") == venue_type:
-            matching_venues.append({
-                "id": venue.get("id"),
-                "name": tags.get("name", "Unnamed Venue"),
-                "latitude": venue.get("lat"),
-                "longitude": venue.get("lon"),
-                "tags": tags
-            })
-    
-    # If no venues found, expand search
-    if not matching_venues:
-        ctx.info(f"No {venue_type} found within 500m, expanding search to 1000m")
-        venues = await osm_client.get_nearby_pois(
-            avg_lat, avg_lon, 
-            radius=1000,
-            categories=["amenity"]
-        )
-        
-        for venue in venues:
-            tags = venue.get("tags", {})
-            if tags.get("amenity") == venue_type:
-                matching_venues.append({
-                    "id": venue.get("id"),
-                    "name": tags.get("name", "Unnamed Venue"),
-                    "latitude": venue.get("lat"),
-                    "longitude": venue.get("lon"),
-                    "tags": tags
-                })
+        matching_venues.append({
+            "id": venue.get("id"),
+            "name": tags.get("name", "Unnamed Venue"),
+            "latitude": lats[i],
+            "longitude": lons[i],
+            "tags": tags
+        })
     
     # Return the result
     return {
@@ -515,7 +452,7 @@ async def suggest_meeting_point(
             "latitude": avg_lat,
             "longitude": avg_lon
         },
-        "suggested_venues": matching_venues[:5],  # Top 5 venues
+        "suggested_venues": matching_venues,
         "venue_type": venue_type,
-        "total_options": len(matching_venues)
+        "total_options": int(indices.size)
     }
@@ -28,15 +28,19 @@ async def geocode_address(address: str, ctx: Context) -> List[Dict]:
     osm_client = ctx.request_context.lifespan_context.osm_client
     results = await osm_client.geocode(address)
     
-    # Enhance results with additional context
-    for result in results:
-        if "lat" in result and "lon" in result:
-            result["coordinates"] = {
+    # Enhance results with additional context; the client's results are cached and
+    # shared between callers, so each one is copied rather than modified
+    return [
+        {
+            **result,
+            "coordinates": {
                 "latitude": float(result["lat"]),
                 "longitude": float(result["lon"])
             }
-    
-    return results
+        }
+        if "lat" in result and "lon" in result else result
+        for result in results
+    ]
 
 @mcp.tool()
 async def reverse_geocode(latitude: float, longitude: float, ctx: Context) -> Dict:
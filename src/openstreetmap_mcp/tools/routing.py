@@ -1,6 +1,45 @@
 from typing import Dict, Any, List
+import asyncio
+import logging
+from operator import itemgetter
 from mcp.server.fastmcp import Context
-from osm_mcp_server.instance import mcp
+from osm_mcp_server.instance import mcp, log_to_client
+from osm_mcp_server.client import OSRM_GEOMETRIES, OSRM_OVERVIEWS, OSRM_PROFILES
+
+_VALID_MODES = frozenset(OSRM_PROFILES)
+
+def _route_steps(route: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten the legs of an OSRM route into compact turn-by-turn steps"""
+    # Built in a single comprehension: only four fields per step are kept, and long
+    # routes can carry thousands of steps
+    return [
+        {
+            "instruction": step.get("maneuver", {}).get("instruction", ""),
+            "distance": step.get("distance"),
+            "duration": step.get("duration"),
+            "name": step.get("name", "")
+        }
+        for leg in route.get("legs", ())
+        for step in leg.get("steps", ())
+    ]
+
+def _columns(points: List[List[float]]) -> Dict[str, List[float]]:
+    """Split [lon, lat] pairs into separate latitude and longitude lists"""
+    lons, lats = map(list, zip(*points)) if points else ([], [])
+    return {"lats": lats, "lons": lons}
+
+def _soa_geometry(geometry: Any) -> Any:
+    """GeoJSON route geometry with its coordinate pairs split into columns"""
+    if not isinstance(geometry, dict) or "coordinates" not in geometry:
+        return geometry
+    return {"type": geometry.get("type"), **_columns(geometry["coordinates"])}
+
+def _soa_waypoints(waypoints: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """OSRM waypoints as parallel name, latitude and longitude lists"""
+    return {
+        "names": [waypoint.get("name", "") for waypoint in waypoints],
+        **_columns([waypoint["location"] for waypoint in waypoints])
+    }
 
 @mcp.tool()
 async def get_route_directions(
@@ -12,7 +51,9 @@ async def get_route_directions(
     mode: str = "car",
     steps: bool = False,
     overview: str = "simplified",
-    annotations: bool = False
+    annotations: bool = False,
+    layout: str = "aos",
+    geometries: str = "geojson"
 ) -> Dict[str, Any]:
     """
     Calculate detailed route directions between two geographic points.
@@ -30,6 +71,10 @@ async def get_route_directions(
         steps: Turn-by-turn instructions (True/False, Default: False)
         overview: Geometry output ("full", "simplified", "false"; Default: "simplified")
         annotations: Additional segment info (True/False, Default: False)
+        layout: Coordinate layout ("aos": OSRM's list of points; "soa": separate "lats"/"lons"
+                lists for the geometry and waypoints, ready for vectorized processing; Default: "aos")
+        geometries: Geometry encoding ("geojson": coordinate list; "polyline6"/"polyline": OSRM's
+                    compact encoded string, returned as-is for the caller to decode; Default: "geojson")
     
     Returns:
         Dictionary with routing information (summary, directions, geometry, waypoints)
@@ -49,12 +94,26 @@ async def get_route_directions(
     osm_client = ctx.request_context.lifespan_context.osm_client
     
     # Validate transportation mode
-    valid_modes = ["car", "bike", "foot"]
-    if mode not in valid_modes:
-        ctx.warning(f"Invalid mode '{mode}'. Using 'car' instead.")
+    if mode not in _VALID_MODES:
+        await log_to_client(ctx, logging.WARNING, "Invalid mode '%s'. Using 'car' instead.", mode)
         mode = "car"
     
-    ctx.info(f"Calculating {mode} route from ({from_latitude}, {from_longitude}) to ({to_latitude}, {to_longitude})")
+    if layout not in ("aos", "soa"):
+        await log_to_client(ctx, logging.WARNING, "Invalid layout '%s'. Using 'aos' instead.", layout)
+        layout = "aos"
+    
+    if overview not in OSRM_OVERVIEWS:
+        await log_to_client(ctx, logging.WARNING, "Invalid overview '%s'. Using 'simplified' instead.", overview)
+        overview = "simplified"
+    
+    if geometries not in OSRM_GEOMETRIES:
+        await log_to_client(ctx, logging.WARNING, "Invalid geometries '%s'. Using 'geojson' instead.", geometries)
+        geometries = "geojson"
+    
+    await log_to_client(
+        ctx, logging.INFO, "Calculating %s route from (%s, %s) to (%s, %s)",
+        mode, from_latitude, from_longitude, to_latitude, to_longitude
+    )
     
     # Get route from OSRM
     route_data = await osm_client.get_route(
@@ -63,24 +122,23 @@ async def get_route_directions(
         mode,
         steps=steps,
         overview=overview,
-        annotations=annotations
+        annotations=annotations,
+        geometries=geometries
     )
     
     # Process and simplify the response
     if "routes" in route_data and len(route_data["routes"]) > 0:
         route = route_data["routes"][0]
         
-        # Extract turn-by-turn directions
-        steps_list = []
-        if "legs" in route:
-            for leg in route["legs"]:
-                for step in leg.get("steps", []):
-                    steps_list.append({
-                        "instruction": step.get("maneuver", {}).get("instruction", ""),
-                        "distance": step.get("distance"),
-                        "duration": step.get("duration"),
-                        "name": step.get("name", "")
-                    })
+        # Extract turn-by-turn directions; OSRM only sends steps when they were requested
+        steps_list = _route_steps(route) if steps else []
+        
+        geometry = route.get("geometry")
+        waypoints = route_data.get("waypoints", [])
+        if layout == "soa":
+            # Encoded polylines are strings and pass through unchanged
+            geometry = _soa_geometry(geometry)
+            waypoints = _soa_waypoints(waypoints)
         
         return {
             "summary": {
@@ -89,8 +147,8 @@ async def get_route_directions(
                 "mode": mode
             },
             "directions": steps_list,
-            "geometry": route.get("geometry"),
-            "waypoints": route_data.get("waypoints", [])
+            "geometry": geometry,
+            "waypoints": waypoints
         }
     else:
         raise Exception("No route found")
@@ -103,7 +161,8 @@ async def analyze_commute(
     work_longitude: float,
     ctx: Context,
     modes: List[str] = ["car", "foot", "bike"],
-    depart_at: str = None  # Time in HH:MM format, e.g. "08:30"
+    depart_at: str = None,  # Time in HH:MM format, e.g. "08:30"
+    include_directions: bool = True
 ) -> Dict[str, Any]:
     """
     Perform a detailed commute analysis between home and work locations.
@@ -120,64 +179,76 @@ async def analyze_commute(
         work_longitude: Workplace location longitude (decimal degrees)
         modes: List of transportation modes to analyze (options: "car", "foot", "bike")
         depart_at: Optional departure time (format: "HH:MM") for time-sensitive routing
+        include_directions: Include turn-by-turn directions for each mode (Default: True); pass
+                            False for a much smaller response with just the distances and durations
         
     Returns:
         Comprehensive commute analysis with:
         - Summary comparing all transportation modes
         - Detailed route information for each mode
         - Total distance and duration for each option
-        - Turn-by-turn directions
+        - Turn-by-turn directions (unless include_directions is False)
     """
     osm_client = ctx.request_context.lifespan_context.osm_client
     
-    # Get address information for both locations
-    home_info = await osm_client.reverse_geocode(home_latitude, home_longitude)
-    work_info = await osm_client.reverse_geocode(work_latitude, work_longitude)
+    # Drop unknown and repeated modes so each valid one is routed exactly once
+    modes = list(dict.fromkeys(m for m in modes if m in _VALID_MODES)) or ["car"]
     
-    # Get commute information for each mode
-    commute_options = []
+    await log_to_client(ctx, logging.INFO, "Calculating %s routes for commute analysis", ", ".join(modes))
     
-    for mode in modes:
-        ctx.info(f"Calculating {mode} route for commute analysis")
-        
-        # Get route from OSRM
-        try:
-            route_data = await osm_client.get_route(
+    # Get address information for both locations and a route from OSRM for each
+    # mode concurrently, so the total wait is the slowest request rather than the sum
+    home_info, work_info, *routes = await asyncio.gather(
+        osm_client.reverse_geocode(home_latitude, home_longitude),
+        osm_client.reverse_geocode(work_latitude, work_longitude),
+        *(
+            # Only the summary and steps are used, so skip geometry and per-node annotations
+            osm_client.get_route(
                 home_latitude, home_longitude,
                 work_latitude, work_longitude,
-                mode
+                mode,
+                steps=include_directions,
+                overview="false",
+                annotations=False
             )
+            for mode in modes
+        ),
+        return_exceptions=True
+    )
+    for info in (home_info, work_info):
+        if isinstance(info, Exception):
+            raise info
+    
+    # Get commute information for each mode; failed modes are kept apart so the
+    # routed ones can be ordered by duration without a fallback key
+    routed_options = []
+    failed_options = []
+    
+    for mode, route_data in zip(modes, routes):
+        try:
+            if isinstance(route_data, Exception):
+                raise route_data
             
             if "routes" in route_data and len(route_data["routes"]) > 0:
                 route = route_data["routes"][0]
                 
-                # Extract directions
-                steps = []
-                if "legs" in route:
-                    for leg in route["legs"]:
-                        for step in leg.get("steps", []):
-                            steps.append({
-                                "instruction": step.get("maneuver", {}).get("instruction", ""),
-                                "distance": step.get("distance"),
-                                "duration": step.get("duration"),
-                                "name": step.get("name", "")
-                            })
-                
-                commute_options.append({
+                option = {
                     "mode": mode,
                     "distance_km": round(route.get("distance", 0) / 1000, 2),
-                    "duration_minutes": round(route.get("duration", 0) / 60, 1),
-                    "directions": steps
-                })
+                    "duration_minutes": round(route.get("duration", 0) / 60, 1)
+                }
+                if include_directions:
+                    option["directions"] = _route_steps(route)
+                routed_options.append(option)
         except Exception as e:
-            ctx.warning(f"Error getting {mode} route: {str(e)}")
-            commute_options.append({
+            await log_to_client(ctx, logging.WARNING, "Error getting %s route: %s", mode, e)
+            failed_options.append({
                 "mode": mode,
                 "error": str(e)
             })
     
-    # Sort by duration (fastest first)
-    commute_options.sort(key=lambda x: x.get("duration_minutes", float("inf")))
+    # Sort by duration (fastest first), failed modes last
+    routed_options.sort(key=itemgetter("duration_minutes"))
     
     return {
         "home": {
@@ -194,7 +265,154 @@ async def analyze_commute(
             },
             "address": work_info.get("display_name", "Unknown location")
         },
-        "commute_options": commute_options,
-        "fastest_option": commute_options[0]["mode"] if commute_options else None,
+        "commute_options": routed_options + failed_options,
+        "fastest_option": routed_options[0]["mode"] if routed_options else None,
         "depart_at": depart_at
     }
+
+@mcp.tool()
+async def get_travel_times(
+    from_latitude: float,
+    from_longitude: float,
+    destinations: List[Dict[str, float]],
+    ctx: Context,
+    modes: List[str] = ["car"]
+) -> Dict[str, Any]:
+    """
+    Calculate travel times and distances from one location to many destinations.
+    
+    This tool uses the OSRM table service to compute the travel duration and distance from a
+    single starting point to every destination in one request per transportation mode, without
+    building full routes. Ideal for ranking candidate locations by accessibility, such as
+    finding the closest of several offices, schools, or stores.
+    
+    Args:
+        from_latitude: Starting point latitude (decimal degrees)
+        from_longitude: Starting point longitude (decimal degrees)
+        destinations: List of dictionaries, each containing the latitude and longitude of a destination
+                     Example: [{"latitude": 51.3295516, "longitude": 9.4576721}, {"latitude": 51.3181, "longitude": 9.4915}]
+        modes: List of transportation modes to compare (options: "car", "foot", "bike")
+        
+    Returns:
+        Travel time matrix including:
+        - Starting point coordinates
+        - Each destination with distance (km) and duration (minutes) per mode
+        - Errors for any mode that could not be calculated
+    """
+    osm_client = ctx.request_context.lifespan_context.osm_client
+    
+    if not destinations:
+        raise ValueError("Need at least one destination")
+    
+    for mode in modes:
+        if mode not in _VALID_MODES:
+            raise ValueError(f"Invalid mode '{mode}'. Options are: {', '.join(OSRM_PROFILES)}")
+    
+    points = [(dest.get("latitude", 0), dest.get("longitude", 0)) for dest in destinations]
+    
+    # One table request per mode, all modes concurrently
+    await log_to_client(ctx, logging.INFO, "Calculating %s travel times to %d destinations", ", ".join(modes), len(points))
+    tables = await asyncio.gather(
+        *(osm_client.get_route_table(from_latitude, from_longitude, points, mode) for mode in modes),
+        return_exceptions=True
+    )
+    
+    results = [
+        {"coordinates": {"latitude": lat, "longitude": lon}, "modes": {}}
+        for lat, lon in points
+    ]
+    errors = {}
+    for mode, table in zip(modes, tables):
+        if isinstance(table, Exception):
+            await log_to_client(ctx, logging.WARNING, "Error getting %s travel times: %s", mode, table)
+            errors[mode] = str(table)
+            continue
+        
+        # A single source row; unreachable destinations come back as null
+        durations = table.get("durations", [[None] * len(points)])[0]
+        distances = table.get("distances", [[None] * len(points)])[0]
+        for result, duration, distance in zip(results, durations, distances):
+            result["modes"][mode] = {
+                "distance_km": round(distance / 1000, 2) if distance is not None else None,
+                "duration_minutes": round(duration / 60, 1) if duration is not None else None
+            }
+    
+    return {
+        "origin": {
+            "latitude": from_latitude,
+            "longitude": from_longitude
+        },
+        "destinations": results,
+        "errors": errors
+    }
+
+@mcp.tool()
+async def batch_routes(
+    pairs: List[Dict[str, float]],
+    ctx: Context,
+    mode: str = "car"
+) -> Dict[str, Any]:
+    """
+    Calculate route distances and durations for many origin/destination pairs at once.
+    
+    This tool routes every pair concurrently in a single call, instead of one
+    get_route_directions call per pair. Only the route summary is returned for each pair,
+    keeping the response compact. Useful for comparing many trips, such as candidate homes
+    against several workplaces.
+    
+    Args:
+        pairs: List of dictionaries with from_latitude, from_longitude, to_latitude and to_longitude
+               Example: [{"from_latitude": 51.3334193, "from_longitude": 9.4540423,
+                          "to_latitude": 51.3295516, "to_longitude": 9.4576721}]
+        mode: Transportation mode ("car", "bike", "foot")
+        
+    Returns:
+        Routes in input order, each with:
+        - From and to coordinates
+        - Distance (km) and duration (minutes), or an error if that pair could not be routed
+    """
+    osm_client = ctx.request_context.lifespan_context.osm_client
+    
+    if not pairs:
+        raise ValueError("Need at least one pair")
+    
+    if mode not in _VALID_MODES:
+        raise ValueError(f"Invalid mode '{mode}'. Options are: {', '.join(OSRM_PROFILES)}")
+    
+    points = [
+        (
+            pair.get("from_latitude", 0), pair.get("from_longitude", 0),
+            pair.get("to_latitude", 0), pair.get("to_longitude", 0)
+        )
+        for pair in pairs
+    ]
+    
+    await log_to_client(ctx, logging.INFO, "Calculating %d %s routes", len(points), mode)
+    route_results = await osm_client.batch_routes(points, mode, overview="false")
+    
+    routes = []
+    failed = 0
+    for (from_lat, from_lon, to_lat, to_lon), route_data in zip(points, route_results):
+        entry = {
+            "from": {"latitude": from_lat, "longitude": from_lon},
+            "to": {"latitude": to_lat, "longitude": to_lon}
+        }
+        if isinstance(route_data, Exception):
+            entry["error"] = str(route_data)
+        elif route_data.get("routes"):
+            route = route_data["routes"][0]
+            entry["distance_km"] = round(route.get("distance", 0) / 1000, 2)
+            entry["duration_minutes"] = round(route.get("duration", 0) / 60, 1)
+        else:
+            entry["error"] = "No route found"
+        if "error" in entry:
+            failed += 1
+        routes.append(entry)
+    
+    if failed:
+        await log_to_client(ctx, logging.WARNING, "%d of %d routes could not be calculated", failed, len(points))
+    
+    return {
+        "mode": mode,
+        "routes": routes
+    }
@@ -1,6 +1,8 @@
 from typing import Dict, Any, List
+import logging
 from mcp.server.fastmcp import Context
-from osm_mcp_server.instance import mcp
+from osm_mcp_server.instance import mcp, log_to_client
+from osm_mcp_server.utils import element_coords
 
 @mcp.tool()
 async def find_nearby_places(
@@ -9,7 +11,8 @@ async def find_nearby_places(
     ctx: Context,
     radius: float = 1000,  # meters
     categories: List[str] = None,
-    limit: int = 20
+    limit: int = 20,
+    include_tags: bool = False
 ) -> Dict[str, Any]:
     """
     Discover points of interest and amenities near a specific location.
@@ -26,13 +29,14 @@ async def find_nearby_places(
         categories: List of OSM categories to search for (e.g., ["amenity", "shop", "tourism"]).
                    If omitted, searches common categories.
         limit: Maximum number of total results to return
+        include_tags: Include the raw OSM tags of each place (defaults to False)
         
     Returns:
         Structured dictionary containing:
         - Original query parameters
         - Total count of places found
         - Results grouped by category and subcategory
-        - Each place includes name, coordinates, and associated tags
+        - Each place includes name and coordinates (plus tags if include_tags is set)
     """
     osm_client = ctx.request_context.lifespan_context.osm_client
     
@@ -40,42 +44,43 @@ async def find_nearby_places(
     if not categories:
         categories = ["amenity", "shop", "tourism", "leisure"]
     
-    ctx.info(f"Searching for places within {radius}m of ({latitude}, {longitude})")
+    await log_to_client(ctx, logging.INFO, "Searching for places within %sm of (%s, %s)", radius, latitude, longitude)
     places = await osm_client.get_nearby_pois(latitude, longitude, radius, categories)
     
     # Group results by category
     results_by_category = {}
+    total_count = 0
     
-    for place in places[:limit]:
+    for place in places:
+        # Apply the limit to matched places rather than to the raw server output
+        if total_count >= limit:
+            break
+        
         tags = place.get("tags", {})
         
-        # Find the matching category
-        for category in categories:
-            if category in tags:
-                subcategory = tags[category]
-                if category not in results_by_category:
-                    results_by_category[category] = {}
-                
-                if subcategory not in results_by_category[category]:
-                    results_by_category[category][subcategory] = []
-                
-                # Add place to appropriate category and subcategory
-                place_info = {
-                    "id": place.get("id"),
-                    "name": tags.get("name", "Unnamed"),
-                    "latitude": place.get("lat"),
-                    "longitude": place.get("lon"),
-                    "tags": tags
-                }
-                
-                results_by_category[category][subcategory].append(place_info)
-    
-    # Calculate total count
-    total_count = sum(
-        len(places)
-        for category_data in results_by_category.values()
-        for places in category_data.values()
-    )
+        # Find the matching category, skipping places outside the categories of interest
+        category = next((c for c in categories if c in tags), None)
+        if category is None:
+            continue
+        
+        subcategory = tags[category]
+        if category not in results_by_category:
+            results_by_category[category] = {}
+        
+        if subcategory not in results_by_category[category]:
+            results_by_category[category][subcategory] = []
+        
+        # Add place to appropriate category and subcategory
+        place_info = {
+            "id": place.get("id"),
+            "name": tags.get("name", "Unnamed"),
+            "latitude": place.get("lat"),
+            "longitude": place.get("lon")
+        }
+        if include_tags:
+            place_info["tags"] = tags
+        results_by_category[category][subcategory].append(place_info)
+        total_count += 1
     
     return {
         "query": {
@@ -123,7 +128,7 @@ async def search_category(
     
     bbox = (min_longitude, min_latitude, max_longitude, max_latitude)
     
-    ctx.info(f"Searching for {category} in bounding box")
+    await log_to_client(ctx, logging.INFO, "Searching for %s in bounding box", category)
     features = await osm_client.search_features_by_category(bbox, category, subcategories)
     
     # Process results
@@ -131,27 +136,14 @@ async def search_category(
     for feature in features:
         tags = feature.get("tags", {})
         
-        # Get coordinates based on feature type
-        coords = {}
-        if feature.get("type") == "node":
-            coords = {
-                "latitude": feature.get("lat"),
-                "longitude": feature.get("lon")
-            }
-        # For ways and relations, use center coordinates if available
-        elif "center" in feature:
-            coords = {
-                "latitude": feature.get("center", {}).get("lat"),
-                "longitude": feature.get("center", {}).get("lon")
-            }
-        
         # Only include features with valid coordinates
-        if coords:
+        lat, lon = element_coords(feature)
+        if lat is not None:
             results.append({
                 "id": feature.get("id"),
                 "type": feature.get("type"),
                 "name": tags.get("name", "Unnamed"),
-                "coordinates": coords,
+                "coordinates": {"latitude": lat, "longitude": lon},
                 "category": category,
                 "subcategory": tags.get(category),
                 "tags": tags
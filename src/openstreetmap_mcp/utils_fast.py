@@ -0,0 +1,119 @@
+import math
+import numpy as np
+
+EARTH_RADIUS = 6371000  # meters
+
+# The equirectangular prefilter keeps points up to this factor beyond the radius, and is
+# skipped for radii larger than PREFILTER_MAX_RADIUS where the flat approximation degrades
+PREFILTER_MARGIN = 1.01
+PREFILTER_MAX_RADIUS = 100000  # meters
+
+# Numba is optional: when it is installed the batch kernels are JIT-compiled
+# (parallel + SIMD over contiguous float64 arrays), otherwise NumPy ufuncs are used.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(fastmath=True, cache=True)
+    def _term(phi0, cos0, lam0, lat, lon):
+        phi = math.radians(lat)
+        s_dphi = math.sin((phi - phi0) * 0.5)
+        s_dlam = math.sin((math.radians(lon) - lam0) * 0.5)
+        return s_dphi * s_dphi + cos0 * math.cos(phi) * s_dlam * s_dlam
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _haversine_terms(lat0, lon0, lats, lons, out):
+        phi0 = math.radians(lat0)
+        cos0 = math.cos(phi0)
+        lam0 = math.radians(lon0)
+        for i in prange(lats.size):
+            out[i] = _term(phi0, cos0, lam0, lats[i], lons[i])
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _haversine_batch(lat0, lon0, lats, lons, out):
+        phi0 = math.radians(lat0)
+        cos0 = math.cos(phi0)
+        lam0 = math.radians(lon0)
+        for i in prange(lats.size):
+            out[i] = 2.0 * EARTH_RADIUS * math.asin(math.sqrt(_term(phi0, cos0, lam0, lats[i], lons[i])))
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _flat_terms(lat0, lon0, lats, lons, scale, out):
+        for i in prange(lats.size):
+            dphi = lats[i] - lat0
+            dlam = abs(lons[i] - lon0)
+            dlam = min(dlam, 360.0 - dlam) * scale
+            out[i] = dphi * dphi + dlam * dlam
+        return out
+else:
+    def _haversine_terms(lat0, lon0, lats, lons, out):
+        # Same hoisting as the JIT kernel: the origin's trig is scalar work done once,
+        # each latitude is converted to radians once, and temporaries are reused in place
+        phi0 = math.radians(lat0)
+        phi = np.radians(lats)
+        s_dphi = np.subtract(phi, phi0)
+        s_dphi *= 0.5
+        np.sin(s_dphi, out=s_dphi)
+        s_dphi *= s_dphi
+        s_dlam = np.radians(lons)
+        s_dlam -= math.radians(lon0)
+        s_dlam *= 0.5
+        np.sin(s_dlam, out=s_dlam)
+        s_dlam *= s_dlam
+        np.cos(phi, out=phi)
+        phi *= math.cos(phi0)
+        np.multiply(phi, s_dlam, out=out)
+        out += s_dphi
+        return out
+
+    def _haversine_batch(lat0, lon0, lats, lons, out):
+        _haversine_terms(lat0, lon0, lats, lons, out)
+        np.sqrt(out, out=out)
+        np.arcsin(out, out=out)
+        out *= 2.0 * EARTH_RADIUS
+        return out
+
+    def _flat_terms(lat0, lon0, lats, lons, scale, out):
+        dlam = np.subtract(lons, lon0)
+        np.abs(dlam, out=dlam)
+        np.minimum(dlam, 360.0 - dlam, out=dlam)
+        dlam *= scale
+        dlam *= dlam
+        np.subtract(lats, lat0, out=out)
+        out *= out
+        out += dlam
+        return out
+
+def _prepare(lats, lons, out):
+    lats = np.ascontiguousarray(lats, dtype=np.float64)
+    lons = np.ascontiguousarray(lons, dtype=np.float64)
+    if out is None:
+        out = np.empty_like(lats)
+    return lats, lons, out
+
+def haversine_terms(lat0, lon0, lats, lons, out=None):
+    """Haversine term sin²(d/2R) from one point to many, for comparing against a radius without arcsin/sqrt"""
+    lats, lons, out = _prepare(lats, lons, out)
+    return _haversine_terms(float(lat0), float(lon0), lats, lons, out)
+
+def haversine_batch(lat0, lon0, lats, lons, out=None):
+    """Great circle distances in meters from one point to many"""
+    lats, lons, out = _prepare(lats, lons, out)
+    return _haversine_batch(float(lat0), float(lon0), lats, lons, out)
+
+def radius_candidates(lat0, lon0, lats, lons, radius):
+    """Indices of the points that may lie within radius meters, a cheap superset to run the exact test on"""
+    lats, lons, out = _prepare(lats, lons, None)
+    if radius > PREFILTER_MAX_RADIUS:
+        return np.arange(lats.size)
+    # Longitude is scaled by the cosine at the most poleward latitude the radius reaches,
+    # which understates east-west distances anywhere in the band, so no true match is
+    # dropped; points outside the band are rejected by the latitude term alone
+    band = math.degrees(radius / EARTH_RADIUS)
+    scale = math.cos(math.radians(min(abs(lat0) + band, 90.0)))
+    terms = _flat_terms(float(lat0), float(lon0), lats, lons, scale, out)
+    return np.flatnonzero(terms <= (band * PREFILTER_MARGIN) ** 2)